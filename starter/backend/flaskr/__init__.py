@@ -1,12 +1,26 @@
 import os
-from flask import Flask, request, abort, jsonify
+import gzip
+from functools import wraps
+from flask import Flask, Response, request, abort, jsonify, make_response, \
+    current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import random
 
-from models import setup_db, Question, Category
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from models import setup_db, bank_state, Question, Category
+from tenancy import TENANT_HEADER, current_tenant, record, resolve_tenant, \
+    tenant_metrics
 
 QUESTIONS_PER_PAGE = 10
+# How long browsers may reuse a CORS preflight answer
+CORS_MAX_AGE = 86400
+# Bodies smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 500
 
 # Paginated Questions
 
@@ -19,6 +33,65 @@ def pagination(request, selection):
     current_questions = questions[start:end]
     return current_questions
 
+# Conditional GET
+
+
+def conditional(view):
+    # Validators come from the bank version, so a matching If-None-Match
+    # is answered before any row is loaded. If-Modified-Since alone never
+    # yields a 304: Last-Modified has one second resolution and cannot
+    # tell apart two writes made within the same second.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        state = bank_state()
+        etag = "bank-{}-{}".format(current_tenant() or "default",
+                                   state["version"])
+        if request.if_none_match.contains_weak(etag):
+            record(current_tenant(), "not_modified")
+            response = Response(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+        # Weak, because the body may be re-encoded by compress()
+        response.set_etag(etag, weak=True)
+        response.last_modified = state["last_modified"]
+        # Caches must revalidate every time, or the list shown right after
+        # an add or delete would come from the cache; a 304 keeps it cheap
+        response.cache_control.public = True
+        response.cache_control.no_cache = True
+        response.vary.add('Accept-Encoding')
+        if current_app.config.get("TENANTS"):
+            # Tenants share URLs, so shared caches must key on the tenant
+            response.vary.add(current_app.config.get("TENANT_HEADER",
+                                                     TENANT_HEADER))
+        return response
+    return wrapper
+
+# Response compression
+
+
+def compress(response):
+    if (response.status_code != 200 or response.direct_passthrough or
+            'Content-Encoding' in response.headers):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    if brotli is not None and request.accept_encodings['br']:
+        response.set_data(brotli.compress(data))
+        response.headers['Content-Encoding'] = 'br'
+    elif request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(data))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        return response
+    response.vary.add('Accept-Encoding')
+    return response
+
+
 def create_app(test_config=None):
     # creating an instance of the app and configuring it
     app = Flask(__name__, instance_relative_config=False)
@@ -26,19 +99,28 @@ def create_app(test_config=None):
         # load the instance config, if it exists, when not testing
         app.config.from_pyfile("config.py", silent=True)
     setup_db(app)
-    CORS(app, resources={r"/api/*": {"origins": "*"}})
-    # DONE: Use the after_request decorator to set Access-Control-Allow
-    # CORS Headers
+    # DONE: Set Access-Control-Allow CORS Headers. Flask-Cors adds them
+    # to every /api/ response, so no hook may set them a second time
+    CORS(app, resources={r"/api/*": {"origins": "*"}},
+         methods=['GET', 'POST', 'PATCH', 'DELETE', 'OPTIONS'],
+         allow_headers=['Content-Type', 'Authorization', 'If-None-Match',
+                        'If-Modified-Since',
+                        app.config.get("TENANT_HEADER", TENANT_HEADER)],
+         expose_headers=['ETag', 'Last-Modified'],
+         max_age=CORS_MAX_AGE)
+
+    # Route every request to its tenant's question bank
+    @app.before_request
+    def before_request():
+        resolve_tenant()
+        record(current_tenant(), "requests")
+
     @app.after_request
     def after_request(response):
-        response.headers.add('Access-Control_Allow-Headers',
-                             'Content-Type, Authorization')
-        response.headers.add('Access-Control_Allow-Methods',
-                             'GET, POST, PATCH, DELETE, OPTIONS')
-        return response
-   
+        return compress(response)
 
     @app.route('/api/categories')
+    @conditional
     def get_categories():
         try:
             every_category = Category.query.order_by(Category.id).all()
@@ -57,6 +139,16 @@ def create_app(test_config=None):
         except():
             abort(404)
 
+    # Metrics of the tenant making the request
+    @app.route('/api/tenants/metrics')
+    def get_tenant_metrics():
+        tenant = current_tenant()
+        return jsonify({
+            "success": True,
+            "tenant": tenant or "default",
+            "metrics": tenant_metrics(tenant)
+        })
+
     # COMPLETED:
     # Create an endpoint to handle GET requests for questions,
     # including pagination (every 10 questions).
@@ -70,6 +162,7 @@ def create_app(test_config=None):
     # '''
 
     @app.route('/api/questions', methods=['GET'])
+    @conditional
     def get_questions():
         page = 0
         if request.args.get("page"):
@@ -223,6 +316,7 @@ def create_app(test_config=None):
     # categories in the left column will cause only questions of that
     # category to be shown.
     @app.route('/api/categories/<int:category_id>/questions', methods=['GET'])
+    @conditional
     def category_questions(category_id):
         try:
             selection = Question.query.filter(
@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+from flask import abort, current_app, g, has_app_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, orm
+
+'''
+Tenant routing
+    Each customer gets its own question bank. The TENANTS config maps a
+    tenant name to either {"database_uri": ...} for a separate database
+    or {"schema": ...} for a schema of SQLALCHEMY_DATABASE_URI.
+    Requests without a tenant use the default bank.
+'''
+TENANT_HEADER = 'X-Tenant'
+TENANT_MAX_ENGINES = 8
+TENANT_ENGINE_IDLE_SECONDS = 60
+
+'''
+resolve_tenant()
+    picks the tenant from the first label of the host name. The tenant
+    header is only honoured on hosts that name no tenant, and a header
+    that disagrees with the host, or names an unknown tenant, is a 404,
+    so a client of one tenant's host can never reach another's bank.
+'''
+def resolve_tenant():
+    g.tenant = None
+    tenants = current_app.config.get("TENANTS")
+    if not tenants:
+        return
+
+    header = current_app.config.get("TENANT_HEADER", TENANT_HEADER)
+    claimed = request.headers.get(header)
+    subdomain = request.host.split(':')[0].split('.')[0]
+    if subdomain in tenants:
+        if claimed is not None and claimed != subdomain:
+            abort(404)
+        g.tenant = subdomain
+        return
+
+    if claimed is None:
+        return
+    if claimed not in tenants:
+        abort(404)
+    g.tenant = claimed
+
+def current_tenant():
+    if not has_app_context():
+        return None
+    return g.get("tenant")
+
+'''
+Per-tenant metrics
+    plain counters keyed by tenant, None being the default bank
+'''
+_metrics = defaultdict(Counter)
+_metrics_lock = threading.Lock()
+
+def record(tenant, key, amount=1):
+    with _metrics_lock:
+        _metrics[tenant][key] += amount
+
+def tenant_metrics(tenant):
+    with _metrics_lock:
+        metrics = dict(_metrics[tenant])
+    if tenant is None:
+        engine = current_app.extensions["sqlalchemy"].db.engine
+    else:
+        engine = engines.peek(tenant)
+    if engine is not None and hasattr(engine.pool, "checkedout"):
+        metrics["connections_checked_out"] = engine.pool.checkedout()
+    return metrics
+
+'''
+TenantEngines
+    one pooled engine per tenant, created on first use. Once more than
+    TENANT_MAX_ENGINES are open, the least recently used idle engines
+    are disposed. An engine only counts as idle when none of its
+    connections are checked out and it has not been handed out for
+    TENANT_ENGINE_IDLE_SECONDS, so an engine returned by get() cannot be
+    disposed before its caller checks out a connection. While every
+    engine is busy the limit is exceeded rather than enforced.
+'''
+class TenantEngines(object):
+
+  def __init__(self):
+    self._engines = OrderedDict()
+    self._last_used = {}
+    self._lock = threading.Lock()
+
+  def get(self, app, tenant):
+    with self._lock:
+      engine = self._engines.get(tenant)
+      if engine is None:
+        engine = self._create(app, tenant)
+        self._engines[tenant] = engine
+        record(tenant, "engines_created")
+      self._engines.move_to_end(tenant)
+      self._last_used[tenant] = time.monotonic()
+      self._evict(app.config.get("TENANT_MAX_ENGINES", TENANT_MAX_ENGINES),
+                  app.config.get("TENANT_ENGINE_IDLE_SECONDS",
+                                 TENANT_ENGINE_IDLE_SECONDS))
+      return engine
+
+  def clear(self):
+    with self._lock:
+      for engine in self._engines.values():
+        engine.dispose()
+      self._engines.clear()
+      self._last_used.clear()
+
+  def peek(self, tenant):
+    with self._lock:
+      return self._engines.get(tenant)
+
+  def _create(self, app, tenant):
+    bank = app.config["TENANTS"][tenant]
+    options = bank.get("engine_options", {})
+    if "database_uri" in bank:
+      return create_engine(bank["database_uri"], **options)
+    return create_engine(
+      app.config["SQLALCHEMY_DATABASE_URI"],
+      execution_options={"schema_translate_map": {None: bank["schema"]}},
+      **options)
+
+  def _evict(self, max_engines, idle_seconds):
+    now = time.monotonic()
+    for name in list(self._engines):
+      if len(self._engines) <= max_engines:
+        break
+      engine = self._engines[name]
+      if getattr(engine.pool, "checkedout", lambda: 0)():
+        continue
+      if now - self._last_used[name] < idle_seconds:
+        continue
+      del self._engines[name]
+      del self._last_used[name]
+      engine.dispose()
+      record(name, "engines_evicted")
+
+engines = TenantEngines()
+
+'''
+TenantSession
+    binds every query to the engine of the current tenant
+'''
+class TenantSession(SignallingSession):
+
+  def get_bind(self, mapper=None, clause=None):
+    tenant = current_tenant()
+    if tenant is not None:
+      return engines.get(self.app, tenant)
+    return SignallingSession.get_bind(self, mapper, clause)
+
+class TenantSQLAlchemy(SQLAlchemy):
+
+  def create_session(self, options):
+    return orm.sessionmaker(class_=TenantSession, db=self, **options)
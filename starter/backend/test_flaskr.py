@@ -2,6 +2,7 @@ import os
 import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine
 
 from models import setup_db, Question, Category
 from flaskr import create_app
@@ -50,6 +51,105 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['categories'], True)
 
+    # GET Categories - conditional GET with a matching ETag
+    def test_retrieve_categories_not_modified(self):
+        res = self.client().get('/api/categories')
+        etag = res.headers['ETag']
+
+        res = self.client().get('/api/categories',
+                                headers={"If-None-Match": etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+        self.assertEqual(res.headers['ETag'], etag)
+        self.assertIn('no-cache', res.headers['Cache-Control'])
+
+    # GET Categories - If-Modified-Since alone is always answered in full
+    def test_retrieve_categories_if_modified_since(self):
+        res = self.client().get('/api/categories')
+        last_modified = res.headers['Last-Modified']
+
+        res = self.client().get('/api/categories',
+                                headers={"If-Modified-Since": last_modified})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(res.headers['Last-Modified'], last_modified)
+
+    # GET Questions - ETag changes once the bank is written to
+    def test_retrieve_questions_etag_changes_after_create(self):
+        res = self.client().get('/api/questions')
+        etag = res.headers['ETag']
+
+        self.client().post('/api/questions', json=self.new_question)
+        res = self.client().get('/api/questions',
+                                headers={"If-None-Match": etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+        # Clean up
+        Question.query.order_by(Question.id.desc()).first().delete()
+
+    # GET Questions - the ETag follows bank_versions in the database, so a
+    # bump from another connection (another worker, or psql) is seen
+    def test_retrieve_questions_etag_follows_database(self):
+        res = self.client().get('/api/questions')
+        etag = res.headers['ETag']
+
+        engine = create_engine(self.app.config["SQLALCHEMY_DATABASE_URI"])
+        engine.execute("UPDATE bank_versions SET version = version + 1")
+        engine.dispose()
+        res = self.client().get('/api/questions',
+                                headers={"If-None-Match": etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    # GET Questions - gzip when the client accepts it
+    def test_retrieve_questions_gzip(self):
+        res = self.client().get('/api/questions',
+                                headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res.headers['Vary'])
+
+    # OPTIONS Preflight - cacheable CORS headers
+    def test_preflight_cors_headers(self):
+        res = self.client().options('/api/questions', headers={
+            "Origin": "http://localhost:3000",
+            "Access-Control-Request-Method": "GET"})
+
+        self.assertEqual(res.headers['Access-Control-Allow-Origin'],
+                         'http://localhost:3000')
+        self.assertEqual(
+            len(res.headers.getlist('Access-Control-Allow-Methods')), 1)
+        self.assertIn('GET', res.headers['Access-Control-Allow-Methods'])
+        self.assertEqual(res.headers.getlist('Access-Control-Max-Age'),
+                         ['86400'])
+
+    # GET Tenant metrics - requests without a tenant use the default bank
+    def test_retrieve_tenant_metrics_default(self):
+        res = self.client().get('/api/tenants/metrics')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['tenant'], "default")
+        self.assertGreater(data['metrics']['requests'], 0)
+
+    # GET Questions - unknown tenant
+    def test_retrieve_questions_unknown_tenant(self):
+        self.app.config["TENANTS"] = {"acme": {"schema": "acme"}}
+        res = self.client().get('/api/questions',
+                                headers={"X-Tenant": "globex"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
     # GET Questions - Paginated
     def test_retrieve_questions_paginated(self):
         res = self.client().get('/api/questions')
@@ -0,0 +1,175 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask
+from sqlalchemy.pool import QueuePool
+from werkzeug.exceptions import NotFound
+
+from models import setup_db, bank_state, db, Question
+from tenancy import TenantEngines, current_tenant, engines, resolve_tenant
+
+
+class TenancyTestCase(unittest.TestCase):
+    """This class represents the tenant routing test case. It runs on
+    sqlite files, so it needs no Postgres."""
+
+    def setUp(self):
+        """Define a default bank and two tenant banks."""
+        self.dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config["TENANTS"] = {
+            "acme": {"database_uri": self.sqlite("acme")},
+            "globex": {"database_uri": self.sqlite("globex")},
+            "initech": {"schema": "initech"}
+        }
+        setup_db(self.app, self.sqlite("default"))
+
+    def tearDown(self):
+        """Executed after reach test"""
+        engines.clear()
+        shutil.rmtree(self.dir)
+
+    def sqlite(self, name):
+        return "sqlite:///" + os.path.join(self.dir, name + ".db")
+
+    def tenant_for(self, host, tenant_header=None):
+        headers = {}
+        if tenant_header is not None:
+            headers["X-Tenant"] = tenant_header
+        with self.app.test_request_context('/', base_url="http://" + host,
+                                           headers=headers):
+            resolve_tenant()
+            return current_tenant()
+
+    # Subdomain selects the tenant
+    def test_resolve_tenant_from_subdomain(self):
+        self.assertEqual(self.tenant_for("acme.trivia.example.com"), "acme")
+
+    # Header selects the tenant on a host that names none
+    def test_resolve_tenant_from_header(self):
+        self.assertEqual(self.tenant_for("trivia.example.com", "globex"),
+                         "globex")
+        self.assertIsNone(self.tenant_for("trivia.example.com"))
+
+    # Header may not override the host's tenant
+    def test_resolve_tenant_header_disagrees_with_subdomain(self):
+        self.assertEqual(self.tenant_for("acme.trivia.example.com", "acme"),
+                         "acme")
+        with self.assertRaises(NotFound):
+            self.tenant_for("acme.trivia.example.com", "globex")
+
+    # Queries of a tenant go to that tenant's engine
+    def test_session_binds_to_tenant_engine(self):
+        with self.app.test_request_context(
+                '/', base_url="http://acme.trivia.example.com"):
+            resolve_tenant()
+            bind = db.session.get_bind()
+
+        self.assertIs(bind, engines.peek("acme"))
+        self.assertEqual(str(bind.url), self.sqlite("acme"))
+
+    # Schema tenants share the default database through schema_translate_map
+    def test_schema_tenant_translates_schema(self):
+        engine = engines.get(self.app, "initech")
+
+        self.assertEqual(str(engine.url), self.sqlite("default"))
+        self.assertEqual(
+            engine.get_execution_options()["schema_translate_map"],
+            {None: "initech"})
+
+    # Engines are created on first use only, and then reused
+    def test_engines_created_lazily(self):
+        registry = TenantEngines()
+        self.assertIsNone(registry.peek("acme"))
+
+        engine = registry.get(self.app, "acme")
+
+        self.assertIs(registry.get(self.app, "acme"), engine)
+        self.assertIsNone(registry.peek("globex"))
+
+    # The least recently used idle engine is evicted first
+    def test_engines_evicted_least_recently_used(self):
+        self.app.config["TENANT_MAX_ENGINES"] = 2
+        self.app.config["TENANT_ENGINE_IDLE_SECONDS"] = 0
+        registry = TenantEngines()
+        registry.get(self.app, "acme")
+        registry.get(self.app, "globex")
+        registry.get(self.app, "acme")
+
+        registry.get(self.app, "initech")
+
+        self.assertIsNotNone(registry.peek("acme"))
+        self.assertIsNone(registry.peek("globex"))
+        self.assertIsNotNone(registry.peek("initech"))
+
+    # Engines with checked out connections are never evicted
+    def test_busy_engines_not_evicted(self):
+        self.app.config["TENANT_MAX_ENGINES"] = 2
+        self.app.config["TENANT_ENGINE_IDLE_SECONDS"] = 0
+        self.app.config["TENANTS"]["acme"]["engine_options"] = {
+            "poolclass": QueuePool}
+        registry = TenantEngines()
+        connection = registry.get(self.app, "acme").connect()
+        registry.get(self.app, "globex")
+
+        registry.get(self.app, "initech")
+
+        self.assertIsNotNone(registry.peek("acme"))
+        self.assertIsNone(registry.peek("globex"))
+        connection.close()
+
+    # Recently handed out engines are never evicted
+    def test_recently_used_engines_not_evicted(self):
+        self.app.config["TENANT_MAX_ENGINES"] = 1
+        registry = TenantEngines()
+        registry.get(self.app, "acme")
+
+        registry.get(self.app, "globex")
+
+        self.assertIsNotNone(registry.peek("acme"))
+        self.assertIsNotNone(registry.peek("globex"))
+
+    # A write changes its own tenant's bank version only
+    def test_write_changes_only_own_bank_version(self):
+        for tenant in ("acme", "globex"):
+            db.Model.metadata.create_all(engines.get(self.app, tenant))
+
+        def state(host):
+            with self.app.test_request_context('/', base_url="http://" + host):
+                resolve_tenant()
+                return bank_state()["version"]
+
+        acme = state("acme.trivia.example.com")
+        globex = state("globex.trivia.example.com")
+
+        with self.app.test_request_context(
+                '/', base_url="http://acme.trivia.example.com"):
+            resolve_tenant()
+            Question(question="This is a question?", answer="Yes",
+                     category=1, difficulty=1).insert()
+
+        self.assertNotEqual(state("acme.trivia.example.com"), acme)
+        self.assertEqual(state("globex.trivia.example.com"), globex)
+
+
+    # A tenant pointed at a new database gets its bank version there too
+    def test_bank_version_follows_tenant_database(self):
+        def state():
+            with self.app.test_request_context(
+                    '/', base_url="http://acme.trivia.example.com"):
+                resolve_tenant()
+                return bank_state()["version"]
+
+        state()
+        engines.clear()
+        self.app.config["TENANTS"]["acme"]["database_uri"] = \
+            self.sqlite("acme-moved")
+
+        self.assertEqual(state(), 1)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()